@@ -0,0 +1,89 @@
+import argparse
+import pickle
+import os
+import time
+
+import numpy as np
+
+from sharded_scoring import ShardedScorer, shards_current, write_shards
+
+def load_artifact(models_dir, name):
+    with open(os.path.join(models_dir, f'{name}.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def build_queries(models_dir, n_queries, seed):
+    """Pick random users and collect their factor vectors and rated books"""
+    user_to_idx = load_artifact(models_dir, 'user_to_idx')
+    user_factors = load_artifact(models_dir, 'user_factors')
+    ratings_filtered = load_artifact(models_dir, 'ratings_filtered')
+
+    rated_by_user = {
+        user_id: dict(zip(group['ISBN'], group['Book-Rating']))
+        for user_id, group in ratings_filtered.groupby('User-ID')
+    }
+
+    rng = np.random.default_rng(seed)
+    user_ids = rng.choice([u for u in user_to_idx if u in rated_by_user], size=n_queries)
+
+    return [
+        (user_factors[user_to_idx[user_id]], rated_by_user[user_id])
+        for user_id in user_ids
+    ]
+
+def time_queries(fn, queries):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        fn(*query)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput": len(queries) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded scoring from 1 to N shards")
+    parser.add_argument('--models-dir', default='data/models')
+    parser.add_argument('--max-shards', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("📊 SHARDED SCORING BENCHMARK")
+    print("="*60)
+
+    queries = build_queries(args.models_dir, args.queries, args.seed)
+    print(f"🎲 {len(queries)} queries, top-{args.count}, models from {args.models_dir}")
+
+    print(f"\n{'shards':>6} {'method':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8}")
+    baseline = {}
+    for shard_count in range(1, args.max_shards + 1):
+        if not shards_current(args.models_dir, shard_count):
+            write_shards(args.models_dir, shard_count)
+        scorer = ShardedScorer(args.models_dir, shard_count)
+        try:
+            scorer.warm_up()
+            results = {
+                "svd": time_queries(
+                    lambda vector, rated: scorer.svd_top_k(vector, rated.keys(), args.count), queries),
+                "cf": time_queries(
+                    lambda vector, rated: scorer.cf_top_k(rated, args.count), queries)
+            }
+        finally:
+            scorer.shutdown()
+
+        for method, result in results.items():
+            baseline.setdefault(method, result["throughput"])
+            speedup = result["throughput"] / baseline[method]
+            print(f"{shard_count:>6} {method:>6} {result['throughput']:>9.1f} "
+                  f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {speedup:>7.2f}x")
+
+    print("="*60)
+
+if __name__ == '__main__':
+    main()
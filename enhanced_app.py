@@ -1,60 +1,361 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, make_response
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import pickle
 import os
+import threading
+import functools
+import time
+import hashlib
 from datetime import datetime
+from sharded_scoring import ShardedScorer, ShardUnavailable, is_shard_process, shards_current, build_command
+import popularity_cube
+import work_clustering
 
 app = Flask(__name__)
 CORS(app)
 
-# Global variables to store loaded models
-models = {}
-is_loaded = False
+MODELS_DIR = os.environ.get('MODELS_DIR', '../models')
 
-def load_models():
-    """Load all the trained models and data"""
-    global models, is_loaded
+# Artifacts to prefetch in the background after startup ("all", or a comma-separated list)
+MODEL_PREFETCH = os.environ.get('MODEL_PREFETCH', '')
+
+# Seconds before a missing or unreadable artifact is tried again
+MODEL_RETRY_SECONDS = float(os.environ.get('MODEL_RETRY_SECONDS', 60))
+
+# Every model artifact and the artifacts it must be loaded together with
+MODEL_ARTIFACTS = {
+    'books_clean': [],
+    'ratings_filtered': [],
+    'user_item_matrix': [],
+    'item_similarity_df': [],
+    'user_to_idx': [],
+    'idx_to_user': [],
+    'book_to_idx': [],
+    'idx_to_book': [],
+    'user_factors': ['user_to_idx'],
+    'item_factors': ['idx_to_book'],
+    'svd_model': ['user_factors', 'item_factors'],
+    'popular_books': [],
+    'popularity_cube': [],
+    'isbn_to_work': []
+}
+
+class ModelRegistry:
+    """Load model artifacts lazily and thread-safely on first use"""
     
-    try:
-        model_files = {
-            'books_clean': '../models/books_clean.pkl',
-            'ratings_filtered': '../models/ratings_filtered.pkl',
-            'user_item_matrix': '../models/user_item_matrix.pkl',
-            'item_similarity_df': '../models/item_similarity_df.pkl',
-            'user_to_idx': '../models/user_to_idx.pkl',
-            'idx_to_user': '../models/idx_to_user.pkl',
-            'book_to_idx': '../models/book_to_idx.pkl',
-            'idx_to_book': '../models/idx_to_book.pkl',
-            'svd_model': '../models/svd_model.pkl',
-            'user_factors': '../models/user_factors.pkl',
-            'item_factors': '../models/item_factors.pkl',
-            'popular_books': '../models/popular_books.pkl'
+    def __init__(self, models_dir, artifacts):
+        self.models_dir = models_dir
+        self.artifacts = artifacts
+        self._values = {}
+        self._fingerprints = {}
+        self._failed_at = {}
+        self._locks = {name: threading.Lock() for name in artifacts}
+        self._status = {
+            name: {"state": "not_loaded", "load_time_ms": None, "error": None}
+            for name in artifacts
         }
-        
-        for model_name, file_path in model_files.items():
-            if os.path.exists(file_path):
+    
+    def path(self, name):
+        return os.path.join(self.models_dir, f'{name}.pkl')
+    
+    def _failed_recently(self, name):
+        failed_at = self._failed_at.get(name)
+        return failed_at is not None and time.monotonic() - failed_at < MODEL_RETRY_SECONDS
+    
+    def _mark_failed(self, name, state, error):
+        self._failed_at[name] = time.monotonic()
+        self._status[name].update(state=state, error=error)
+    
+    def load(self, name):
+        """Return an artifact, loading it and its dependencies if needed"""
+        if name in self._values:
+            return self._values[name]
+        if name not in self.artifacts or self._failed_recently(name):
+            raise KeyError(name)
+        
+        for dependency in self.artifacts[name]:
+            self.load(dependency)
+        
+        with self._locks[name]:
+            if name in self._values:
+                return self._values[name]
+            # Another thread may have just failed this load while we waited
+            if self._failed_recently(name):
+                raise KeyError(name)
+            
+            file_path = self.path(name)
+            self._status[name]["state"] = "loading"
+            start = time.perf_counter()
+            try:
                 with open(file_path, 'rb') as f:
-                    models[model_name] = pickle.load(f)
-                print(f"✓ Loaded {model_name}")
-            else:
-                print(f"✗ File not found: {file_path}")
-        
-        is_loaded = True
-        print("✅ All models loaded successfully!")
-        
-    except Exception as e:
-        print(f"❌ Error loading models: {e}")
+                    # Stat the open file so the fingerprint matches exactly what was read
+                    stat = os.fstat(f.fileno())
+                    value = pickle.load(f)
+            except Exception as e:
+                self._mark_failed(name, "missing" if isinstance(e, FileNotFoundError) else "failed", str(e))
+                print(f"✗ Could not load {name} from {file_path}: {e} (retrying in {MODEL_RETRY_SECONDS:.0f}s)")
+                raise KeyError(name) from e
+            
+            load_time_ms = (time.perf_counter() - start) * 1000
+            self._failed_at.pop(name, None)
+            self._fingerprints[name] = f"{stat.st_size}:{stat.st_mtime_ns}"
+            self._values[name] = value
+            self._status[name].update(state="loaded", load_time_ms=round(load_time_ms, 2), error=None)
+            print(f"✓ Loaded {name} ({load_time_ms:.0f} ms)")
+            return value
+    
+    def prefetch(self, names):
+        """Load the given artifacts in a background thread"""
+        def run():
+            for name in names:
+                try:
+                    self.load(name)
+                except KeyError:
+                    pass
+        
+        thread = threading.Thread(target=run, name="model-prefetch", daemon=True)
+        thread.start()
+        return thread
+    
+    def fingerprint(self, names):
+        """Version of the given artifacts as held in memory, loading them if needed
+        
+        Each artifact is fingerprinted when it is loaded, so replacing a file on disk
+        does not change the version of content this process still serves.
+        """
+        digest = hashlib.sha1()
+        for name in sorted(names):
+            try:
+                self.load(name)
+                digest.update(f"{name}:{self._fingerprints[name]};".encode())
+            except KeyError:
+                digest.update(f"{name}:missing;".encode())
+        return digest.hexdigest()[:16]
+    
+    def version(self):
+        """Fingerprint of every artifact loaded so far"""
+        return self.fingerprint(list(self._fingerprints))
+    
+    def is_artifact_loaded(self, name):
+        return name in self._values
+    
+    def loaded_artifacts(self):
+        return sorted(self._values)
+    
+    def status(self):
+        """Return the load state and load time of each artifact"""
+        return {name: dict(info) for name, info in self._status.items()}
+    
+    def __getitem__(self, name):
+        return self.load(name)
+    
+    def __contains__(self, name):
+        """Whether an artifact is loaded or loadable; missing files are remembered until the retry window ends"""
+        if name in self._values:
+            return True
+        if name not in self.artifacts or self._failed_recently(name):
+            return False
+        if os.path.exists(self.path(name)):
+            return True
+        self._mark_failed(name, "missing", f"File not found: {self.path(name)}")
+        return False
+    
+    def get(self, name, default=None):
+        try:
+            return self.load(name)
+        except KeyError:
+            return default
+
+# Global model registry; artifacts are loaded on first access
+models = ModelRegistry(MODELS_DIR, MODEL_ARTIFACTS)
+is_loaded = False
+
+def load_models():
+    """Check the model directory and start the optional background prefetch"""
+    global is_loaded
+    
+    if not os.path.isdir(MODELS_DIR):
+        print(f"❌ Model directory not found: {MODELS_DIR}")
         is_loaded = False
+        return
+    
+    is_loaded = True
+    print(f"✅ Model registry ready ({len(MODEL_ARTIFACTS)} artifacts, loaded on demand)")
+    
+    if MODEL_PREFETCH:
+        if MODEL_PREFETCH.strip().lower() == 'all':
+            names = list(MODEL_ARTIFACTS)
+        else:
+            names = [name.strip() for name in MODEL_PREFETCH.split(',') if name.strip()]
+        models.prefetch(names)
+        print(f"⏳ Prefetching {len(names)} artifacts in the background")
+
+# Register models at startup; spawned shard processes re-import this module and must not
+if not is_shard_process():
+    load_models()
+
+# ===================================================================
+# REQUEST COALESCING
+# ===================================================================
+
+# Maximum number of requests allowed to wait on a single in-flight computation
+COALESCE_MAX_WAITERS = int(os.environ.get('COALESCE_MAX_WAITERS', 256))
 
-# Load models at startup
-load_models()
+class CoalescingLimitExceeded(Exception):
+    """Raised when too many requests are already waiting on the same key"""
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers with the same key"""
+    
+    def __init__(self, max_waiters=COALESCE_MAX_WAITERS):
+        self.max_waiters = max_waiters
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'executed': 0, 'coalesced': 0, 'rejected': 0}
+    
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn once per key at a time; concurrent callers wait and share the result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = {
+                    'done': threading.Event(),
+                    'result': {"error": "Coalesced computation failed"},
+                    'exception': None,
+                    'waiters': 0
+                }
+                self._calls[key] = call
+                self._stats['executed'] += 1
+                is_leader = True
+            elif call['waiters'] >= self.max_waiters:
+                self._stats['rejected'] += 1
+                raise CoalescingLimitExceeded(key)
+            else:
+                call['waiters'] += 1
+                self._stats['coalesced'] += 1
+                is_leader = False
+        
+        if not is_leader:
+            call['done'].wait()
+            if call['exception'] is not None:
+                raise call['exception']
+            return call['result']
+        
+        try:
+            call['result'] = fn(*args, **kwargs)
+        except Exception as e:
+            # Waiters see the same failure as the leader
+            call['exception'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+        
+        return call['result']
+    
+    def stats(self):
+        """Return a snapshot of the coalescing counters"""
+        with self._lock:
+            return {
+                **self._stats,
+                'in_flight': len(self._calls),
+                'max_waiters_per_key': self.max_waiters
+            }
+
+request_coalescer = SingleFlight()
+
+def coalesced(name, key=None):
+    """Route concurrent identical calls of the decorated function through request_coalescer
+    
+    key maps the call arguments to the coalescing key; by default the arguments themselves.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return request_coalescer.do((name, call_key), fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# ===================================================================
+# HTTP CACHING
+# ===================================================================
+
+# Seconds clients and CDNs may reuse a response before revalidating
+CACHE_MAX_AGE = int(os.environ.get('CACHE_MAX_AGE', 3600))
+
+def model_etag(artifacts):
+    """ETag for the current request: version of the artifacts it reads plus path and query parameters"""
+    query = sorted(request.args.items(multi=True))
+    key = f"{models.fingerprint(artifacts)}|{request.path}|{query}"
+    return hashlib.sha1(key.encode()).hexdigest()[:32]
+
+def conditional_cache(*artifacts):
+    """Answer If-None-Match with 304 before running the view; tag successful responses
+    
+    artifacts lists the models the response is derived from. A wildcard
+    If-None-Match only matches once the view has confirmed the resource exists.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not is_loaded:
+                return view(*args, **kwargs)
+            
+            etag = model_etag(artifacts)
+            if_none_match = request.if_none_match
+            
+            if not if_none_match.star_tag and if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if if_none_match.star_tag:
+                    response = app.response_class(status=304)
+            
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = f"public, max-age={CACHE_MAX_AGE}"
+            return response
+        return wrapper
+    return decorator
+
+# ===================================================================
+# SHARDED SCORING
+# ===================================================================
+
+# Number of item shards (one scoring process each); 1 scores in-process
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+
+sharded_scorer = None
+sharded_scorer_lock = threading.Lock()
+
+if SHARD_COUNT > 1 and not is_shard_process() and not shards_current(MODELS_DIR, SHARD_COUNT):
+    print(f"⚠️  Shard files for {SHARD_COUNT} shards are missing or stale; {build_command(MODELS_DIR, SHARD_COUNT)}")
+
+def get_sharded_scorer():
+    """Start the shard processes on first use; raises ShardUnavailable (503) until shards are built"""
+    global sharded_scorer
+    
+    with sharded_scorer_lock:
+        if sharded_scorer is None:
+            sharded_scorer = ShardedScorer(MODELS_DIR, SHARD_COUNT)
+        return sharded_scorer
 
 # ===================================================================
 # RECOMMENDATION FUNCTIONS
 # ===================================================================
 
+def resolve_work_isbn(isbn):
+    """Map an edition ISBN to the representative ISBN its work is modelled under"""
+    if 'isbn_to_work' not in models:
+        return isbn
+    return work_clustering.resolve_work(isbn, models['isbn_to_work'])
+
+@coalesced('similar')
 def get_similar_books_api(isbn, n_recommendations=10):
     """Get similar books using item-based collaborative filtering"""
     try:
@@ -90,6 +391,7 @@ def get_similar_books_api(isbn, n_recommendations=10):
     except Exception as e:
         return {"error": str(e)}
 
+@coalesced('user')
 def get_user_recommendations_api(user_id, n_recommendations=10):
     """Get personalized recommendations for a user"""
     try:
@@ -97,7 +399,6 @@ def get_user_recommendations_api(user_id, n_recommendations=10):
             return {"error": "Models not loaded"}
         
         user_item_matrix = models['user_item_matrix']
-        item_similarity_df = models['item_similarity_df']
         books_clean = models['books_clean']
         
         if user_id not in user_item_matrix.index:
@@ -110,22 +411,28 @@ def get_user_recommendations_api(user_id, n_recommendations=10):
         if len(rated_books) == 0:
             return {"error": "User has not rated any books"}
         
-        # Calculate recommendations
-        recommendations = {}
-        
-        for book_isbn, rating in rated_books.items():
-            if book_isbn in item_similarity_df.index:
-                similar_books = item_similarity_df[book_isbn].sort_values(ascending=False)
-                
-                for sim_book_isbn, similarity in similar_books.items():
-                    if sim_book_isbn not in rated_books.index and similarity > 0.1:
-                        if sim_book_isbn in recommendations:
-                            recommendations[sim_book_isbn] += rating * similarity
-                        else:
-                            recommendations[sim_book_isbn] = rating * similarity
-        
-        # Sort and format recommendations
-        sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+        if SHARD_COUNT > 1:
+            # Each shard scores its slice of the similarity columns
+            sorted_recommendations = get_sharded_scorer().cf_top_k(rated_books.to_dict(), n_recommendations)
+        else:
+            item_similarity_df = models['item_similarity_df']
+            
+            # Calculate recommendations
+            recommendations = {}
+            
+            for book_isbn, rating in rated_books.items():
+                if book_isbn in item_similarity_df.index:
+                    similar_books = item_similarity_df[book_isbn].sort_values(ascending=False)
+                    
+                    for sim_book_isbn, similarity in similar_books.items():
+                        if sim_book_isbn not in rated_books.index and similarity > 0.1:
+                            if sim_book_isbn in recommendations:
+                                recommendations[sim_book_isbn] += rating * similarity
+                            else:
+                                recommendations[sim_book_isbn] = rating * similarity
+            
+            # Sort and format recommendations
+            sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
         
         final_recommendations = []
         for isbn, score in sorted_recommendations[:n_recommendations]:
@@ -143,9 +450,12 @@ def get_user_recommendations_api(user_id, n_recommendations=10):
         
         return {"recommendations": final_recommendations}
         
+    except ShardUnavailable:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+@coalesced('svd')
 def get_svd_recommendations_api(user_id, n_recommendations=10):
     """Get recommendations using SVD matrix factorization"""
     try:
@@ -153,10 +463,8 @@ def get_svd_recommendations_api(user_id, n_recommendations=10):
             return {"error": "Models not loaded"}
         
         user_to_idx = models['user_to_idx']
-        idx_to_book = models['idx_to_book']
         user_item_matrix = models['user_item_matrix']
         user_factors = models['user_factors']
-        item_factors = models['item_factors']
         books_clean = models['books_clean']
         
         if user_id not in user_to_idx:
@@ -165,18 +473,26 @@ def get_svd_recommendations_api(user_id, n_recommendations=10):
         user_idx = user_to_idx[user_id]
         user_ratings = user_item_matrix.loc[user_id]
         
-        # Predict ratings
-        predicted_ratings = np.dot(user_factors[user_idx], item_factors.T)
-        
-        # Create recommendations
-        recommendations = []
-        for i, predicted_rating in enumerate(predicted_ratings):
-            book_isbn = idx_to_book[i]
-            if user_ratings[book_isbn] == 0:  # Not rated by user
-                recommendations.append((book_isbn, predicted_rating))
-        
-        # Sort and format
-        recommendations.sort(key=lambda x: x[1], reverse=True)
+        if SHARD_COUNT > 1:
+            # Each shard predicts ratings for its slice of item_factors
+            rated_isbns = user_ratings[user_ratings != 0].index
+            recommendations = get_sharded_scorer().svd_top_k(user_factors[user_idx], rated_isbns, n_recommendations)
+        else:
+            idx_to_book = models['idx_to_book']
+            item_factors = models['item_factors']
+            
+            # Predict ratings
+            predicted_ratings = np.dot(user_factors[user_idx], item_factors.T)
+            
+            # Create recommendations
+            recommendations = []
+            for i, predicted_rating in enumerate(predicted_ratings):
+                book_isbn = idx_to_book[i]
+                if user_ratings[book_isbn] == 0:  # Not rated by user
+                    recommendations.append((book_isbn, predicted_rating))
+            
+            # Sort and format
+            recommendations.sort(key=lambda x: x[1], reverse=True)
         
         final_recommendations = []
         for isbn, pred_rating in recommendations[:n_recommendations]:
@@ -194,6 +510,60 @@ def get_svd_recommendations_api(user_id, n_recommendations=10):
         
         return {"recommendations": final_recommendations}
         
+    except ShardUnavailable:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
+
+# Genre matching is case-insensitive, so /genre/Fiction and /genre/fiction share a flight
+@coalesced('genre', key=lambda genre, n_recommendations=20: (genre.lower(), n_recommendations))
+def get_genre_recommendations_api(genre, n_recommendations=20):
+    """Get popular books matching a genre keyword in title, author, or publisher"""
+    try:
+        if not is_loaded:
+            return {"error": "Models not loaded"}
+        
+        books_clean = models['books_clean']
+        ratings_filtered = models['ratings_filtered']
+        
+        # Search for books that contain the genre in title, author, or publisher
+        genre_lower = genre.lower()
+        genre_mask = (
+            books_clean['Book-Title'].str.lower().str.contains(genre_lower, na=False) |
+            books_clean['Book-Author'].str.lower().str.contains(genre_lower, na=False) |
+            books_clean['Publisher'].str.lower().str.contains(genre_lower, na=False)
+        )
+        
+        genre_books = books_clean[genre_mask]
+        
+        if genre_books.empty:
+            return {"recommendations": []}
+        
+        # Get ratings for these books and sort by popularity and rating
+        book_stats = []
+        for _, book in genre_books.iterrows():
+            book_ratings = ratings_filtered[ratings_filtered['ISBN'] == book['ISBN']]
+            if len(book_ratings) >= 5:  # At least 5 ratings
+                avg_rating = book_ratings['Book-Rating'].mean()
+                rating_count = len(book_ratings)
+                
+                book_stats.append({
+                    'isbn': book['ISBN'],
+                    'title': book['Book-Title'],
+                    'author': book['Book-Author'],
+                    'year': int(book['Year-Of-Publication']),
+                    'publisher': book['Publisher'] if pd.notna(book['Publisher']) else "Unknown",
+                    'image_url': book['Image-URL-M'] if pd.notna(book['Image-URL-M']) else "",
+                    'average_rating': float(avg_rating),
+                    'rating_count': int(rating_count),
+                    'popularity_score': float(avg_rating * np.log(rating_count + 1))
+                })
+        
+        # Sort by popularity score (rating * log(count))
+        book_stats.sort(key=lambda x: x['popularity_score'], reverse=True)
+        
+        return {"recommendations": book_stats[:n_recommendations]}
+        
     except Exception as e:
         return {"error": str(e)}
 
@@ -201,6 +571,16 @@ def get_svd_recommendations_api(user_id, n_recommendations=10):
 # API ENDPOINTS
 # ===================================================================
 
+@app.errorhandler(CoalescingLimitExceeded)
+def handle_coalescing_limit(e):
+    """Shed load when a single key has too many waiting requests"""
+    return jsonify({"error": "Too many concurrent requests for this resource, please retry"}), 503, {"Retry-After": "1"}
+
+@app.errorhandler(ShardUnavailable)
+def handle_shard_unavailable(e):
+    """Shards are not built, or a scoring shard died and could not be restarted"""
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
 @app.route('/')
 def home():
     return jsonify({
@@ -222,18 +602,23 @@ def status():
         "models_loaded": True,
         "total_users": len(models['user_to_idx']),
         "total_books": len(models['book_to_idx']),
-        "total_ratings": len(models['ratings_filtered']),
+        # Only count ratings if they are already in memory so /status never forces a load
+        "total_ratings": len(models['ratings_filtered']) if models.is_artifact_loaded('ratings_filtered') else None,
         "available_endpoints": [
             "/recommend/user/<user_id>",
             "/recommend/similar/<isbn>",
             "/recommend/svd/<user_id>",
-            "/recommend/popular",
+            "/recommend/popular?country=<country>&age=<age>",
             "/recommend/genre/<genre>",
             "/book/<isbn>",
             "/search?q=<query>",
             "/user/<user_id>/ratings",
             "/genres"
-        ]
+        ],
+        "request_coalescing": request_coalescer.stats(),
+        "shard_count": SHARD_COUNT,
+        "model_version": models.version(),
+        "artifacts": models.status()
     })
 
 @app.route('/recommend/user/<int:user_id>')
@@ -255,18 +640,22 @@ def recommend_user(user_id):
     })
 
 @app.route('/recommend/similar/<isbn>')
+@conditional_cache('item_similarity_df', 'books_clean', 'isbn_to_work')
 def recommend_similar(isbn):
     """Get books similar to a given book"""
     n_recs = request.args.get('count', 10, type=int)
     n_recs = min(max(n_recs, 1), 50)
     
-    result = get_similar_books_api(isbn, n_recs)
+    # Editions of one work share a single item, so coalesce and score on the work
+    work_isbn = resolve_work_isbn(isbn)
+    result = get_similar_books_api(work_isbn, n_recs)
     
     if "error" in result:
         return jsonify(result), 404
     
     return jsonify({
         "source_isbn": isbn,
+        "work_isbn": work_isbn,
         "method": "item_similarity",
         "count": len(result["recommendations"]),
         **result
@@ -291,14 +680,30 @@ def recommend_svd(user_id):
     })
 
 @app.route('/recommend/popular')
+@conditional_cache('popular_books', 'popularity_cube')
 def recommend_popular():
-    """Get popular books as fallback recommendations"""
+    """Get popular books as fallback recommendations, optionally for a country/age segment"""
     try:
         if not is_loaded:
             return jsonify({"error": "Models not loaded"}), 500
         
         n_recs = request.args.get('count', 10, type=int)
         n_recs = min(max(n_recs, 1), 50)
+        country = request.args.get('country', '').strip()
+        age = request.args.get('age', type=int)
+        
+        if (country or age is not None) and 'popularity_cube' in models:
+            # Precomputed per-segment top-N, falling back to parent segments when sparse
+            segment, segment_books = popularity_cube.lookup(models['popularity_cube'], country, age)
+            if segment is not None:
+                popular_books = segment_books[:n_recs]
+                
+                return jsonify({
+                    "method": "segment_popularity",
+                    "segment": {"country": segment[0], "age_bucket": segment[1]},
+                    "count": len(popular_books),
+                    "recommendations": popular_books
+                })
         
         popular_books = models['popular_books'][:n_recs]
         
@@ -312,61 +717,25 @@ def recommend_popular():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/recommend/genre/<genre>')
+@conditional_cache('books_clean', 'ratings_filtered')
 def recommend_by_genre(genre):
     """Get book recommendations by genre"""
-    try:
-        if not is_loaded:
-            return jsonify({"error": "Models not loaded"}), 500
-        
-        books_clean = models['books_clean']
-        ratings_filtered = models['ratings_filtered']
-        
-        # Search for books that contain the genre in title, author, or publisher
-        genre_lower = genre.lower()
-        genre_mask = (
-            books_clean['Book-Title'].str.lower().str.contains(genre_lower, na=False) |
-            books_clean['Book-Author'].str.lower().str.contains(genre_lower, na=False) |
-            books_clean['Publisher'].str.lower().str.contains(genre_lower, na=False)
-        )
-        
-        genre_books = books_clean[genre_mask]
-        
-        if genre_books.empty:
-            return jsonify({"recommendations": []})
-        
-        # Get ratings for these books and sort by popularity and rating
-        book_stats = []
-        for _, book in genre_books.iterrows():
-            book_ratings = ratings_filtered[ratings_filtered['ISBN'] == book['ISBN']]
-            if len(book_ratings) >= 5:  # At least 5 ratings
-                avg_rating = book_ratings['Book-Rating'].mean()
-                rating_count = len(book_ratings)
-                
-                book_stats.append({
-                    'isbn': book['ISBN'],
-                    'title': book['Book-Title'],
-                    'author': book['Book-Author'],
-                    'year': int(book['Year-Of-Publication']),
-                    'publisher': book['Publisher'] if pd.notna(book['Publisher']) else "Unknown",
-                    'image_url': book['Image-URL-M'] if pd.notna(book['Image-URL-M']) else "",
-                    'average_rating': float(avg_rating),
-                    'rating_count': int(rating_count),
-                    'popularity_score': float(avg_rating * np.log(rating_count + 1))
-                })
-        
-        # Sort by popularity score (rating * log(count))
-        book_stats.sort(key=lambda x: x['popularity_score'], reverse=True)
-        
-        return jsonify({
-            "genre": genre,
-            "count": len(book_stats[:20]),
-            "recommendations": book_stats[:20]
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    result = get_genre_recommendations_api(genre)
+    
+    if "error" in result:
+        return jsonify(result), 500
+    
+    if not result["recommendations"]:
+        return jsonify({"recommendations": []})
+    
+    return jsonify({
+        "genre": genre,
+        "count": len(result["recommendations"]),
+        **result
+    })
 
 @app.route('/genres')
+@conditional_cache()
 def get_popular_genres():
     """Get list of popular genres/categories"""
     popular_genres = [
@@ -378,6 +747,7 @@ def get_popular_genres():
     return jsonify({"genres": popular_genres})
 
 @app.route('/book/<isbn>')
+@conditional_cache('books_clean', 'ratings_filtered', 'isbn_to_work')
 def get_book_details(isbn):
     """Get detailed information about a specific book"""
     try:
@@ -392,7 +762,8 @@ def get_book_details(isbn):
             return jsonify({"error": "Book not found"}), 404
         
         # Get rating statistics
-        book_ratings = ratings_filtered[ratings_filtered['ISBN'] == isbn]
+        # Ratings are stored under the work's representative ISBN
+        book_ratings = ratings_filtered[ratings_filtered['ISBN'] == resolve_work_isbn(isbn)]
         
         book_data = {
             "isbn": isbn,
@@ -520,8 +891,7 @@ if __name__ == '__main__':
     print("="*60)
     print(f"📊 Models loaded: {is_loaded}")
     if is_loaded:
-        print(f"👥 Users in system: {len(models.get('user_to_idx', {}))}")
-        print(f"📚 Books in system: {len(models.get('book_to_idx', {}))}")
+        print(f"📦 {len(MODEL_ARTIFACTS)} artifacts in {MODELS_DIR}, loaded on first use")
     print("🌐 Server starting on http://localhost:5000")
     print("="*60)
     
@@ -0,0 +1,376 @@
+"""
+Concurrent load-replay harness for the enhanced API.
+
+Starts local server processes against the bundled models, replays a request
+mix at a target rate and sweeps worker/thread counts:
+
+    python load_test.py --workers 1,2,4 --threads 1,4,8 --rates 50,100,200
+
+Each worker is a separate server process on its own port; the client spreads
+requests over them round-robin, standing in for a load balancer. A recorded
+mix can be replayed with --replay requests.jsonl (one {"path": ...} per line).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+DEFAULT_MIX = "user=25,similar=25,svd=15,search=10,genre=10,popular=15"
+
+SEARCH_TERMS = ["harry", "potter", "king", "love", "night", "war", "girl", "house", "life", "secret"]
+GENRES = ["Fiction", "Mystery", "Romance", "Fantasy", "Thriller", "History", "Horror", "Adventure"]
+
+# Artifacts each endpoint needs to score instead of returning an error
+ENDPOINT_ARTIFACTS = {
+    'user': ['user_item_matrix', 'item_similarity_df', 'books_clean'],
+    'svd': ['user_to_idx', 'user_item_matrix', 'user_factors', 'item_factors', 'idx_to_book', 'books_clean'],
+    'similar': ['item_similarity_df', 'books_clean'],
+    'search': ['books_clean'],
+    'genre': ['books_clean', 'ratings_filtered'],
+    'popular': ['popular_books']
+}
+
+# A rate step is sustained while errors stay under MAX_ERROR_RATE and requests leave
+# the client within MAX_LAG_MS of their schedule (p99). Endpoints with fewer than
+# MIN_SAMPLES requests in a step are not judged.
+MAX_ERROR_RATE = 0.01
+MAX_LAG_MS = 250
+MIN_SAMPLES = 20
+
+# ===================================================================
+# REQUEST MIX
+# ===================================================================
+
+def load_artifact(models_dir, name):
+    with open(os.path.join(models_dir, f'{name}.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def id_weights(ids, counts):
+    """Sampling weights proportional to rating activity, so hot ids dominate"""
+    weights = np.array([counts.get(i, 0) + 1 for i in ids], dtype=float)
+    return weights / weights.sum()
+
+def synthesize_requests(models_dir, n_requests, mix, seed):
+    """Draw (endpoint, path) pairs with id distributions from the bundled models"""
+    rng = np.random.default_rng(seed)
+
+    user_ids = list(load_artifact(models_dir, 'user_to_idx'))
+    isbns = list(load_artifact(models_dir, 'book_to_idx'))
+    try:
+        ratings_filtered = load_artifact(models_dir, 'ratings_filtered')
+        user_counts = ratings_filtered['User-ID'].value_counts().to_dict()
+        book_counts = ratings_filtered['ISBN'].value_counts().to_dict()
+    except FileNotFoundError:
+        user_counts, book_counts = {}, {}
+    user_p = id_weights(user_ids, user_counts)
+    book_p = id_weights(isbns, book_counts)
+
+    endpoints = list(mix)
+    endpoint_p = np.array([mix[e] for e in endpoints], dtype=float)
+    endpoint_p /= endpoint_p.sum()
+
+    generators = {
+        'user': lambda: f"/recommend/user/{user_ids[rng.choice(len(user_ids), p=user_p)]}",
+        'svd': lambda: f"/recommend/svd/{user_ids[rng.choice(len(user_ids), p=user_p)]}",
+        'similar': lambda: f"/recommend/similar/{isbns[rng.choice(len(isbns), p=book_p)]}",
+        'search': lambda: f"/search?q={rng.choice(SEARCH_TERMS)}",
+        'genre': lambda: f"/recommend/genre/{rng.choice(GENRES)}",
+        'popular': lambda: "/recommend/popular?count=10"
+    }
+
+    return [
+        (endpoint, generators[endpoint]())
+        for endpoint in rng.choice(endpoints, size=n_requests, p=endpoint_p)
+    ]
+
+def load_replay(path):
+    """Read a recorded request log; the endpoint is the first path segment after /recommend"""
+    replay = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                request_path = json.loads(line)['path']
+                parts = [p for p in request_path.split('?')[0].split('/') if p]
+                endpoint = parts[1] if parts and parts[0] == 'recommend' and len(parts) > 1 else parts[0]
+                replay.append((endpoint, request_path))
+    return replay
+
+def missing_artifacts(models_dir, endpoints):
+    """Artifacts absent from models_dir, per endpoint of the mix"""
+    missing = {}
+    for endpoint in sorted(set(endpoints)):
+        absent = [name for name in ENDPOINT_ARTIFACTS.get(endpoint, [])
+                  if not os.path.exists(os.path.join(models_dir, f'{name}.pkl'))]
+        if absent:
+            missing[endpoint] = absent
+    return missing
+
+def parse_mix(mix):
+    return {name: float(weight) for name, weight in (item.split('=') for item in mix.split(','))}
+
+# ===================================================================
+# SERVERS
+# ===================================================================
+
+def serve(port, threads):
+    """Run enhanced_app with a fixed-size request thread pool"""
+    from werkzeug.serving import BaseWSGIServer
+    from enhanced_app import app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer('127.0.0.1', port, app).serve_forever()
+
+def artifacts_settled(url, artifacts):
+    """Whether the server has finished loading (or given up on) every listed artifact"""
+    try:
+        response = requests.get(f"{url}/status", timeout=1)
+    except requests.exceptions.RequestException:
+        return False
+    if response.status_code != 200:
+        return False
+    states = response.json().get('artifacts', {})
+    return all(states.get(name, {}).get('state') not in ('not_loaded', 'loading') for name in artifacts)
+
+def start_servers(workers, threads, base_port, models_dir, artifacts, timeout=300):
+    """Start one server process per worker and wait until each has loaded the mix's artifacts"""
+    env = {**os.environ, 'MODELS_DIR': os.path.abspath(models_dir), 'MODEL_PREFETCH': 'all'}
+    here = os.path.dirname(os.path.abspath(__file__))
+    processes, urls = [], []
+    for worker in range(workers):
+        port = base_port + worker
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'serve', '--port', str(port), '--threads', str(threads)],
+            cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        urls.append(f"http://127.0.0.1:{port}")
+
+    # Wait for the prefetch so the first rate step does not pay for unpickling
+    deadline = time.time() + timeout
+    for url in urls:
+        while not artifacts_settled(url, artifacts):
+            if time.time() > deadline:
+                stop_servers(processes)
+                raise RuntimeError(f"Server at {url} did not load its models within {timeout}s")
+            time.sleep(0.5)
+    return processes, urls
+
+def warm_up(urls, request_mix):
+    """Send one unmeasured request per endpoint to every server"""
+    first_paths = dict(reversed(request_mix))
+    for url in urls:
+        for path in first_paths.values():
+            try:
+                requests.get(f"{url}{path}", timeout=30)
+            except requests.exceptions.RequestException:
+                pass
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+# ===================================================================
+# LOAD GENERATION
+# ===================================================================
+
+def run_load(urls, request_mix, rate, duration, client_threads):
+    """Issue requests open-loop at `rate` per second; returns the outcomes and the scheduled window"""
+    n_requests = int(rate * duration)
+    schedule = list(itertools.islice(itertools.cycle(request_mix), n_requests))
+    records = []
+    records_lock = threading.Lock()
+    local = threading.local()
+
+    def send(i, endpoint, path, scheduled_at):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sent_at = time.perf_counter()
+        try:
+            status = session.get(f"{urls[i % len(urls)]}{path}", timeout=30).status_code
+        except requests.exceptions.RequestException:
+            status = None
+        # Latency runs from the scheduled send time, so requests queued behind busy
+        # client threads keep their waiting time (no coordinated omission)
+        latency_ms = (time.perf_counter() - scheduled_at) * 1000
+        lag_ms = max(sent_at - scheduled_at, 0) * 1000
+        with records_lock:
+            records.append((endpoint, status, latency_ms, lag_ms))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=client_threads) as executor:
+        for i, (endpoint, path) in enumerate(schedule):
+            executor.submit(send, i, endpoint, path, start + i / rate)
+    # Throughput is taken over the window requests were offered in; the drain
+    # afterwards is already visible in latency and lag
+    return records, n_requests / rate
+
+def is_error(status, allow_not_found):
+    """Timeouts, server errors, and 404s unless the mix may contain unknown ids"""
+    if status is None or status >= 500:
+        return True
+    return status == 404 and not allow_not_found
+
+def summarize(records, window, allow_not_found=False):
+    """Throughput, latency percentiles and error rate per endpoint and overall
+
+    Synthesized requests only use ids from the models, so a 404 there is a
+    failure (usually a missing artifact). Recorded traffic may contain unknown
+    ids, so replays pass allow_not_found=True. "sustained" is None when an
+    endpoint has too few requests in the step to judge.
+    """
+    by_endpoint = defaultdict(list)
+    for endpoint, status, latency_ms, lag_ms in records:
+        by_endpoint[endpoint].append((status, latency_ms, lag_ms))
+        by_endpoint['all'].append((status, latency_ms, lag_ms))
+
+    summary = {}
+    for endpoint, outcomes in by_endpoint.items():
+        latencies = np.array([latency for _, latency, _ in outcomes])
+        lags = np.array([lag for _, _, lag in outcomes])
+        errors = sum(1 for status, _, _ in outcomes if is_error(status, allow_not_found))
+        error_rate = errors / len(outcomes)
+        p99_lag_ms = float(np.percentile(lags, 99))
+        sustained = None
+        if len(outcomes) >= MIN_SAMPLES:
+            sustained = error_rate < MAX_ERROR_RATE and p99_lag_ms <= MAX_LAG_MS
+        summary[endpoint] = {
+            "requests": len(outcomes),
+            "throughput": (len(outcomes) - errors) / window,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "p99_lag_ms": p99_lag_ms,
+            "error_rate": error_rate,
+            "sustained": sustained
+        }
+    return summary
+
+def print_summary(workers, threads, rate, summary):
+    print(f"\n⚙️  workers={workers} threads={threads} offered={rate} req/s")
+    print(f"   {'endpoint':>8} {'reqs':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'lag p99':>8} {'errors':>7}")
+    for endpoint in sorted(summary, key=lambda e: (e == 'all', e)):
+        s = summary[endpoint]
+        print(f"   {endpoint:>8} {s['requests']:>6} {s['throughput']:>8.1f} {s['p50_ms']:>8.1f} "
+              f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['p99_lag_ms']:>8.1f} {s['error_rate']:>6.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a request mix against local servers")
+    parser.add_argument('--models-dir', default='data/models')
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated worker process counts")
+    parser.add_argument('--threads', default='1,4,8', help="comma-separated threads per worker")
+    parser.add_argument('--rates', default='25,50,100,200', help="comma-separated offered req/s")
+    parser.add_argument('--duration', type=float, default=10, help="seconds per rate step")
+    parser.add_argument('--client-threads', type=int, default=64)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--replay', help="JSONL file of recorded requests to replay instead of synthesizing")
+    parser.add_argument('--base-port', type=int, default=5100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write all results as JSON to this file")
+    args = parser.parse_args()
+
+    workers_list = [int(w) for w in args.workers.split(',')]
+    threads_list = [int(t) for t in args.threads.split(',')]
+    rates = [float(r) for r in args.rates.split(',')]
+
+    if args.replay:
+        request_mix = load_replay(args.replay)
+    else:
+        n_requests = int(max(rates) * args.duration)
+        request_mix = synthesize_requests(args.models_dir, n_requests, parse_mix(args.mix), args.seed)
+
+    print("\n" + "="*60)
+    print("🚦 LOAD REPLAY")
+    print("="*60)
+    print(f"📨 {len(request_mix)} requests in mix, {args.duration}s per rate step")
+
+    endpoints_in_mix = [endpoint for endpoint, _ in request_mix]
+    missing = missing_artifacts(args.models_dir, endpoints_in_mix)
+    for endpoint, names in missing.items():
+        print(f"⚠️  {endpoint}: missing {', '.join(names)} in {args.models_dir}; expect errors")
+    needed_artifacts = sorted({name for endpoint in set(endpoints_in_mix)
+                               for name in ENDPOINT_ARTIFACTS.get(endpoint, [])})
+
+    results = []
+    for workers, threads in itertools.product(workers_list, threads_list):
+        processes, urls = start_servers(workers, threads, args.base_port, args.models_dir, needed_artifacts)
+        # Saturation point: the last offered rate an endpoint kept up with before falling behind
+        sustained, saturated, served = {}, set(), set()
+        try:
+            warm_up(urls, request_mix)
+            for rate in rates:
+                records, window = run_load(urls, request_mix, rate, args.duration, args.client_threads)
+                summary = summarize(records, window, allow_not_found=bool(args.replay))
+                print_summary(workers, threads, rate, summary)
+                results.append({"workers": workers, "threads": threads, "rate": rate, "summary": summary})
+                for endpoint, s in summary.items():
+                    if s["error_rate"] < 1:
+                        served.add(endpoint)
+                    if endpoint in saturated or s["sustained"] is None:
+                        continue
+                    if s["sustained"]:
+                        sustained[endpoint] = rate
+                    else:
+                        saturated.add(endpoint)
+        finally:
+            stop_servers(processes)
+
+        def saturation_point(endpoint):
+            if endpoint not in served:
+                return "n/a (all errors)"
+            if endpoint not in sustained and endpoint not in saturated:
+                return f"n/a (under {MIN_SAMPLES} requests per step)"
+            return sustained.get(endpoint, f"below {rates[0]}")
+
+        endpoints = sorted(set(endpoints_in_mix) | {'all'})
+        print("   📈 saturation point (offered req/s): " +
+              ", ".join(f"{e}={saturation_point(e)}" for e in endpoints))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    print("="*60)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_parser = argparse.ArgumentParser()
+        serve_parser.add_argument('command')
+        serve_parser.add_argument('--port', type=int, required=True)
+        serve_parser.add_argument('--threads', type=int, default=8)
+        serve_args = serve_parser.parse_args()
+        serve(serve_args.port, serve_args.threads)
+    else:
+        main()
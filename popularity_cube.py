@@ -0,0 +1,164 @@
+"""
+Offline-built popularity cube over (country, age bucket) user segments.
+
+Every segment cell and every rollup ('all' in place of a dimension) keeps its
+top-N books, so the API can answer segment-aware popularity requests with a
+dictionary lookup. Build it from the raw CSVs with:
+
+    python popularity_cube.py
+"""
+
+import argparse
+import bisect
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from work_clustering import build_work_index, collapse_editions
+
+ALL = 'all'
+UNKNOWN = 'unknown'
+
+# Users outside this age range are treated as unknown (same filter as the notebooks)
+MIN_AGE, MAX_AGE = 5, 100
+AGE_EDGES = [5, 18, 25, 35, 45, 55, 65]
+AGE_LABELS = ['5-17', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+
+# ===================================================================
+# SEGMENT KEYS
+# ===================================================================
+
+def normalize_country(location):
+    """Take the country from a Book-Crossing 'city, state, country' location"""
+    if not isinstance(location, str):
+        return UNKNOWN
+    country = location.rsplit(',', 1)[-1].strip().lower()
+    return country if country and country != 'n/a' else UNKNOWN
+
+def age_bucket(age):
+    """Map an age to its bucket label"""
+    if age is None or pd.isna(age) or not MIN_AGE <= age <= MAX_AGE:
+        return UNKNOWN
+    return AGE_LABELS[bisect.bisect_right(AGE_EDGES, age) - 1]
+
+def segment_users(users):
+    """Vectorized country and age bucket for every user"""
+    country = users['Location'].str.rsplit(',', n=1).str[-1].str.strip().str.lower()
+    country = country.where(country.notna() & (country != '') & (country != 'n/a'), UNKNOWN)
+
+    age = pd.to_numeric(users['Age'], errors='coerce')
+    age = age.where((age >= MIN_AGE) & (age <= MAX_AGE))
+    bucket = pd.cut(age, bins=AGE_EDGES + [np.inf], labels=AGE_LABELS, right=False)
+    bucket = bucket.astype(object).where(bucket.notna(), UNKNOWN)
+
+    return pd.DataFrame({'User-ID': users['User-ID'], 'country': country, 'age_bucket': bucket})
+
+# ===================================================================
+# CUBE
+# ===================================================================
+
+def build_popularity_cube(users, ratings, books, isbn_to_work=None, top_n=50, min_ratings=5, min_books=10):
+    """Top-N books per (country, age bucket) cell and per rollup
+
+    With isbn_to_work, ratings are counted per work under its representative
+    ISBN, matching the models. Cells with fewer than min_books qualifying books
+    are left out so lookups fall back to their parent segment.
+    """
+    rated = ratings[(ratings['Book-Rating'] > 0) & ratings['ISBN'].isin(books['ISBN'])]
+    if isbn_to_work is not None:
+        rated = collapse_editions(rated, isbn_to_work)
+    rated = rated.merge(segment_users(users), on='User-ID', how='inner')
+
+    segments = {}
+    for levels in (['country', 'age_bucket'], ['country'], ['age_bucket'], []):
+        stats = rated.groupby(levels + ['ISBN'])['Book-Rating'].agg(['count', 'mean']).reset_index()
+        stats = stats[stats['count'] >= min_ratings]
+        stats = stats.assign(popularity_score=stats['mean'] * np.log(stats['count'] + 1))
+        stats = stats.sort_values(levels + ['popularity_score'], ascending=[True] * len(levels) + [False])
+
+        groups = stats.groupby(levels).head(top_n).groupby(levels) if levels else [((), stats.head(top_n))]
+        for key, group in groups:
+            if len(group) < min_books:
+                continue
+            values = dict(zip(levels, key if isinstance(key, tuple) else (key,)))
+            segment = (values.get('country', ALL), values.get('age_bucket', ALL))
+            segments[segment] = list(zip(
+                group['ISBN'].tolist(),
+                group['count'].astype(int).tolist(),
+                group['mean'].round(2).tolist()
+            ))
+
+    used_isbns = {isbn for entries in segments.values() for isbn, _, _ in entries}
+    book_info = books[books['ISBN'].isin(used_isbns)]
+    return {
+        'books': {
+            row['ISBN']: (row['Book-Title'], row['Book-Author'], int(row['Year-Of-Publication']))
+            for _, row in book_info.iterrows()
+        },
+        'segments': segments,
+        'top_n': top_n
+    }
+
+def lookup(cube, country=None, age=None):
+    """Return (segment, books) for the most specific populated segment"""
+    country = normalize_country(country) if country else ALL
+    bucket = age_bucket(age) if age is not None else ALL
+    # UNKNOWN is the segment of users who gave no valid age; an invalid request age means any age
+    if bucket == UNKNOWN:
+        bucket = ALL
+
+    for segment in ((country, bucket), (country, ALL), (ALL, bucket), (ALL, ALL)):
+        entries = cube['segments'].get(segment)
+        if entries:
+            break
+    else:
+        return None, []
+
+    books = []
+    for isbn, rating_count, average_rating in entries:
+        title, author, year = cube['books'][isbn]
+        books.append({
+            'ISBN': isbn,
+            'Title': title,
+            'Author': author,
+            'Year': year,
+            'Rating_Count': rating_count,
+            'Average_Rating': average_rating
+        })
+    return segment, books
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the demographic popularity cube")
+    parser.add_argument('--raw-dir', default='../data/raw')
+    parser.add_argument('--models-dir', default='../models')
+    parser.add_argument('--top-n', type=int, default=50)
+    parser.add_argument('--min-ratings', type=int, default=5)
+    args = parser.parse_args()
+
+    books = pd.read_csv(os.path.join(args.raw_dir, 'Books.csv'), encoding='latin-1', low_memory=False)
+    ratings = pd.read_csv(os.path.join(args.raw_dir, 'Ratings.csv'), encoding='latin-1', low_memory=False)
+    users = pd.read_csv(os.path.join(args.raw_dir, 'Users.csv'), encoding='latin-1', low_memory=False)
+
+    # Same cleaning as books_clean in the model notebook
+    books = books.dropna(subset=['Book-Title', 'Book-Author']).copy()
+    books['Year-Of-Publication'] = pd.to_numeric(books['Year-Of-Publication'], errors='coerce')
+    books = books[(books['Year-Of-Publication'] >= 1900) & (books['Year-Of-Publication'] <= 2024)]
+    books = books.drop_duplicates(subset=['ISBN'])
+
+    # Use the serving edition-to-work map when it exists so segment lists use the same work ISBNs
+    work_index_path = os.path.join(args.models_dir, 'isbn_to_work.pkl')
+    if os.path.exists(work_index_path):
+        with open(work_index_path, 'rb') as f:
+            isbn_to_work = pickle.load(f)
+    else:
+        isbn_to_work = build_work_index(books, ratings[ratings['Book-Rating'] > 0])
+
+    cube = build_popularity_cube(users, ratings, books, isbn_to_work,
+                                 top_n=args.top_n, min_ratings=args.min_ratings)
+
+    path = os.path.join(args.models_dir, 'popularity_cube.pkl')
+    with open(path, 'wb') as f:
+        pickle.dump(cube, f)
+    print(f"✓ Saved {len(cube['segments'])} segments to {path}")
@@ -0,0 +1,255 @@
+"""
+Item-partitioned sharded scoring with scatter-gather top-k merge.
+
+The item index space of item_factors and the columns of item_similarity_df
+are split into contiguous ranges, one per shard. Every shard runs in its own
+process and only keeps its slice in memory. A query is scattered to all
+shards, each shard returns its local top-k, and the coordinator merges them.
+
+Shard processes only ever load their own pre-partitioned file. The files are
+written offline, loading the full matrices a single time; the serving process
+refuses to start shards while they are missing or older than their sources:
+
+    python sharded_scoring.py --models-dir data/models --shards 4
+"""
+
+import argparse
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# Minimum item similarity that contributes to a collaborative filtering score
+SIMILARITY_THRESHOLD = 0.1
+
+# Full artifacts a shard is sliced from
+SOURCE_ARTIFACTS = ['item_factors', 'idx_to_book', 'item_similarity_df']
+
+# State of the shard held by the current worker process
+_shard = {}
+
+class ShardUnavailable(Exception):
+    """Raised when shards are not built or a shard process cannot answer even after being restarted"""
+
+def is_shard_process():
+    """True while a spawned shard process is re-importing the parent's main module
+
+    Spawn sets _inheriting on the child's process object for the duration of that
+    import; parent_process() is only filled in afterwards, so it cannot be used.
+    Modules use this to skip import-time startup work such as model loading.
+    """
+    return getattr(multiprocessing.current_process(), '_inheriting', False)
+
+# ===================================================================
+# PARTITIONING
+# ===================================================================
+
+def shard_bounds(n_items, shard_count):
+    """Split range(n_items) into shard_count contiguous [start, stop) ranges"""
+    edges = np.linspace(0, n_items, shard_count + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+def shard_path(models_dir, shard_id, shard_count):
+    return os.path.join(models_dir, 'shards', str(shard_count), f'shard_{shard_id}.pkl')
+
+def load_sources(models_dir):
+    sources = {}
+    for name in SOURCE_ARTIFACTS:
+        with open(os.path.join(models_dir, f'{name}.pkl'), 'rb') as f:
+            sources[name] = pickle.load(f)
+    return sources
+
+def build_shard(sources, shard_id, shard_count):
+    """Slice the full artifacts down to the items owned by one shard"""
+    item_factors = sources['item_factors']
+    idx_to_book = sources['idx_to_book']
+    item_similarity_df = sources['item_similarity_df']
+
+    start, stop = shard_bounds(len(idx_to_book), shard_count)[shard_id]
+    sim_start, sim_stop = shard_bounds(item_similarity_df.shape[1], shard_count)[shard_id]
+
+    return {
+        'factor_isbns': np.array([idx_to_book[i] for i in range(start, stop)], dtype=object),
+        'item_factors': np.ascontiguousarray(item_factors[start:stop]),
+        'similarity_isbns': np.array(item_similarity_df.columns[sim_start:sim_stop], dtype=object),
+        'similarity_rows': {isbn: i for i, isbn in enumerate(item_similarity_df.index)},
+        'similarity': np.ascontiguousarray(item_similarity_df.iloc[:, sim_start:sim_stop].values)
+    }
+
+def shards_current(models_dir, shard_count):
+    """Whether every shard file exists and is newer than the artifacts it was sliced from"""
+    # Sources may be absent on nodes that only ship the shard files
+    sources = [os.path.join(models_dir, f'{name}.pkl') for name in SOURCE_ARTIFACTS]
+    newest_source = max((os.path.getmtime(path) for path in sources if os.path.exists(path)), default=0)
+    for shard_id in range(shard_count):
+        path = shard_path(models_dir, shard_id, shard_count)
+        if not os.path.exists(path) or os.path.getmtime(path) < newest_source:
+            return False
+    return True
+
+def build_command(models_dir, shard_count):
+    return f"run: python sharded_scoring.py --models-dir {models_dir} --shards {shard_count}"
+
+def write_shards(models_dir, shard_count):
+    """Load the full artifacts once and write one partitioned file per shard"""
+    sources = load_sources(models_dir)
+    for shard_id in range(shard_count):
+        path = shard_path(models_dir, shard_id, shard_count)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(build_shard(sources, shard_id, shard_count), f)
+        print(f"✓ Wrote {path}")
+
+# ===================================================================
+# SHARD WORKER
+# ===================================================================
+
+def _check_isolated():
+    """Fail if re-importing the parent's main module started its model registry here"""
+    main = sys.modules.get('__mp_main__')
+    registry = getattr(main, 'models', None)
+    loaded = registry.loaded_artifacts() if hasattr(registry, 'loaded_artifacts') else []
+    if getattr(main, 'is_loaded', False) or loaded:
+        raise RuntimeError(f"Shard process started the main module's model registry (loaded: {loaded})")
+
+def _init_shard(models_dir, shard_id, shard_count):
+    """Load this process's pre-partitioned shard; never the full matrices"""
+    path = shard_path(models_dir, shard_id, shard_count)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Shard file {path} is missing; {build_command(models_dir, shard_count)}")
+    with open(path, 'rb') as f:
+        _shard.update(pickle.load(f))
+    _check_isolated()
+
+def _shard_size():
+    return len(_shard['factor_isbns'])
+
+def _local_top_k(isbns, scores, k):
+    if len(scores) == 0 or k <= 0:
+        return []
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return [(isbns[i], float(scores[i])) for i in top]
+
+def _svd_top_k(user_vector, rated_isbns, k):
+    """Top-k predicted ratings among this shard's unrated items"""
+    isbns = _shard['factor_isbns']
+    scores = _shard['item_factors'] @ user_vector
+    unrated = ~np.isin(isbns, list(rated_isbns))
+    return _local_top_k(isbns[unrated], scores[unrated], k)
+
+def _cf_top_k(rated_books, k):
+    """Top-k item-based scores among this shard's unrated items"""
+    rows = _shard['similarity_rows']
+    rated = [(rows[isbn], rating) for isbn, rating in rated_books.items() if isbn in rows]
+    if not rated:
+        return []
+
+    row_idx, ratings = zip(*rated)
+    similarity = _shard['similarity'][list(row_idx)]
+    similarity = np.where(similarity > SIMILARITY_THRESHOLD, similarity, 0.0)
+    scores = np.asarray(ratings, dtype=float) @ similarity
+
+    isbns = _shard['similarity_isbns']
+    candidates = (similarity > 0).any(axis=0) & ~np.isin(isbns, list(rated_books))
+    return _local_top_k(isbns[candidates], scores[candidates], k)
+
+# ===================================================================
+# COORDINATOR
+# ===================================================================
+
+class ShardedScorer:
+    """Scatter scoring queries to one process per item shard and merge the results"""
+
+    def __init__(self, models_dir, shard_count):
+        self.models_dir = models_dir
+        self.shard_count = shard_count
+        # Building shards loads the full matrices, so it never happens in the serving process
+        if not shards_current(models_dir, shard_count):
+            raise ShardUnavailable(
+                f"Shard files for {shard_count} shards are missing or stale in {models_dir}; "
+                f"{build_command(models_dir, shard_count)}"
+            )
+
+        self._context = multiprocessing.get_context('spawn')
+        self._restart_lock = threading.Lock()
+        self._executors = [self._start_executor(shard_id) for shard_id in range(shard_count)]
+        atexit.register(self.shutdown)
+
+    def _start_executor(self, shard_id):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=self._context,
+            initializer=_init_shard,
+            initargs=(self.models_dir, shard_id, self.shard_count)
+        )
+
+    def _restart_shard(self, shard_id, broken):
+        """Replace a dead shard process, unless another thread already did"""
+        with self._restart_lock:
+            if self._executors[shard_id] is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executors[shard_id] = self._start_executor(shard_id)
+                print(f"⚠️  Restarted shard {shard_id}/{self.shard_count}")
+            return self._executors[shard_id]
+
+    def _submit(self, shard_id, fn, *args):
+        executor = self._executors[shard_id]
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            return executor, None
+
+    def _shard_result(self, shard_id, executor, future, fn, *args):
+        """Result of one shard, retried once on a fresh process if the shard died"""
+        if future is not None:
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                pass
+
+        executor = self._restart_shard(shard_id, executor)
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool as e:
+            raise ShardUnavailable(f"Shard {shard_id} is unavailable") from e
+
+    def _scatter_gather(self, fn, *args, k):
+        submitted = [self._submit(shard_id, fn, *args, k) for shard_id in range(self.shard_count)]
+        local_results = itertools.chain.from_iterable(
+            self._shard_result(shard_id, executor, future, fn, *args, k)
+            for shard_id, (executor, future) in enumerate(submitted)
+        )
+        return heapq.nlargest(k, local_results, key=lambda x: x[1])
+
+    def svd_top_k(self, user_vector, rated_isbns, k):
+        """Top-k (isbn, predicted_rating) pairs for a user's factor vector"""
+        return self._scatter_gather(_svd_top_k, np.asarray(user_vector), list(rated_isbns), k=k)
+
+    def cf_top_k(self, rated_books, k):
+        """Top-k (isbn, score) pairs for a {isbn: rating} dict of rated books"""
+        return self._scatter_gather(_cf_top_k, dict(rated_books), k=k)
+
+    def warm_up(self):
+        """Block until every shard process has loaded its slice; returns items per shard"""
+        return [executor.submit(_shard_size).result() for executor in self._executors]
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write pre-partitioned shard artifacts")
+    parser.add_argument('--models-dir', default='../models')
+    parser.add_argument('--shards', type=int, required=True)
+    args = parser.parse_args()
+
+    write_shards(args.models_dir, args.shards)
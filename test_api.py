@@ -1,5 +1,6 @@
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 # Base URL
 BASE_URL = "http://localhost:5000"
@@ -22,7 +23,12 @@ def test_endpoint(endpoint, description):
                 print(f"   📚 Found {data.get('count', 0)} recommendations")
                 if data['recommendations']:
                     first_rec = data['recommendations'][0]
-                    print(f"   📖 First: {first_rec['title']} by {first_rec['author']}")
+                    # Popular-book records use capitalized keys
+                    title = first_rec.get('title', first_rec.get('Title'))
+                    author = first_rec.get('author', first_rec.get('Author'))
+                    print(f"   📖 First: {title} by {author}")
+                if 'segment' in data:
+                    print(f"   🌍 Segment: {data['segment']}")
             elif 'results' in data:
                 print(f"   🔍 Found {data.get('count', 0)} search results")
             elif 'ratings' in data:
@@ -35,6 +41,62 @@ def test_endpoint(endpoint, description):
     except Exception as e:
         print(f"   ❌ Error: {e}")
 
+def test_coalescing(endpoints, description):
+    """Fire identical concurrent requests and check the coalescing counters in /status"""
+    print(f"\n🧪 Testing: {description}")
+    print(f"   URLs: {', '.join(BASE_URL + e for e in set(endpoints))} ({len(endpoints)} concurrent requests)")
+    
+    try:
+        before = requests.get(f"{BASE_URL}/status").json()['request_coalescing']
+        with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+            statuses = list(executor.map(lambda e: requests.get(f"{BASE_URL}{e}").status_code, endpoints))
+        after = requests.get(f"{BASE_URL}/status").json()['request_coalescing']
+        
+        executed = after['executed'] - before['executed']
+        coalesced = after['coalesced'] - before['coalesced']
+        rejected = after['rejected'] - before['rejected']
+        shed = statuses.count(503)
+        
+        print(f"   Status codes: { {code: statuses.count(code) for code in sorted(set(statuses))} }")
+        print(f"   🔁 executed={executed} coalesced={coalesced} rejected={rejected}")
+        
+        if coalesced > 0:
+            print(f"   ✅ Concurrent requests shared {executed} computation(s)")
+        else:
+            print(f"   ⚠️  No overlapping requests observed (computation may be too fast)")
+        
+        if rejected == shed:
+            print(f"   ✅ {shed} request(s) shed with 503, matching the rejected counter")
+            print(f"   💡 Start the server with COALESCE_MAX_WAITERS=1 to exercise shedding")
+        else:
+            print(f"   ❌ {shed} responses were 503 but rejected counter moved by {rejected}")
+            
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+
+def test_conditional_get(endpoint, description):
+    """Fetch an endpoint, then revalidate it with its ETag and expect 304"""
+    print(f"\n🧪 Testing: {description}")
+    print(f"   URL: {BASE_URL}{endpoint}")
+    
+    try:
+        response = requests.get(f"{BASE_URL}{endpoint}")
+        etag = response.headers.get('ETag')
+        print(f"   Status: {response.status_code}, ETag: {etag}, Cache-Control: {response.headers.get('Cache-Control')}")
+        
+        if not etag:
+            print(f"   ❌ No ETag on the response")
+            return
+        
+        revalidated = requests.get(f"{BASE_URL}{endpoint}", headers={'If-None-Match': etag})
+        if revalidated.status_code == 304 and not revalidated.content:
+            print(f"   ✅ Revalidation returned 304 with an empty body")
+        else:
+            print(f"   ❌ Revalidation returned {revalidated.status_code}")
+            
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+
 def main():
     print("🚀 TESTING BOOK RECOMMENDATION API")
     print("=" * 50)
@@ -60,6 +122,8 @@ def main():
     test_endpoint(f"/recommend/user/{random_user}", "User recommendations")
     test_endpoint(f"/recommend/svd/{random_user}", "SVD recommendations")
     test_endpoint("/recommend/popular", "Popular books")
+    test_endpoint("/recommend/popular?country=usa&age=30", "Popular books for a segment")
+    test_endpoint("/recommend/popular?country=usa&age=150", "Popular books with an invalid age (falls back to country)")
     
     # Test with a sample ISBN (you might need to adjust this)
     sample_isbn = "0195153448"  # This should exist in your dataset
@@ -70,6 +134,21 @@ def main():
     test_endpoint(f"/user/{random_user}/ratings", "User ratings")
     test_endpoint("/search?q=harry", "Search functionality")
     
+    # Test HTTP conditional caching
+    test_conditional_get("/genres", "Conditional GET on genres")
+    test_conditional_get("/recommend/popular?count=5", "Conditional GET on popular books")
+    try:
+        response = requests.get(f"{BASE_URL}/recommend/similar/XXXXXXXXXX", headers={'If-None-Match': '*'})
+        if response.status_code == 404:
+            print(f"\n   ✅ If-None-Match: * on a missing book still returns 404")
+        else:
+            print(f"\n   ❌ If-None-Match: * on a missing book returned {response.status_code}")
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+    
+    # Test request coalescing; mixed-case genres must share one flight
+    test_coalescing(["/recommend/genre/Fiction", "/recommend/genre/fiction"] * 10, "Request coalescing")
+    
     print(f"\n✅ API testing completed!")
     print(f"💡 Try opening http://localhost:5000 in your browser")
 
@@ -0,0 +1,69 @@
+"""
+Edition deduplication: collapse ISBNs of the same title/author into one work.
+
+Each work is identified by its representative ISBN (the edition with the most
+ratings), so the user-item matrix, similarity matrix and factors keep using
+ISBN keys and book lookups need no extra mapping. isbn_to_work maps every
+other edition to its representative; representatives map to themselves
+implicitly.
+"""
+
+import pandas as pd
+
+ARTICLES = r'^(?:the|a|an) '
+
+# Edition and format words that differ between printings of one work. Volume, part
+# and series numbers are deliberately kept, as they distinguish separate works.
+EDITION_MARKERS = (
+    r'\b(?:(?:\d+(?:st|nd|rd|th)|first|second|third|revised|updated|expanded|anniversary|'
+    r'special|deluxe|collector s|illustrated|international|school|library|book club|'
+    r'mass market|trade|large print|movie tie in)\s+)+edition\b'
+    r'|\b(?:mass market|trade)?\s*(?:paperback|hardcover|hardback)\b'
+    r'|\b(?:reprint|reissue|large print|unabridged|abridged|audio\s*cassette|audio\s*cd|audiobook|boxed set)\b'
+)
+
+def normalize_titles(titles):
+    """Title key: lowercase, punctuation, edition/format markers and leading article removed"""
+    return (
+        titles.str.lower()
+        .str.replace(r'[^a-z0-9 ]+', ' ', regex=True)
+        .str.replace(EDITION_MARKERS, ' ', regex=True)
+        .str.split().str.join(' ')
+        .str.replace(ARTICLES, '', regex=True)
+    )
+
+def normalize_authors(authors):
+    """Author key: letters and digits only, so 'J. K. Rowling' matches 'J.K. Rowling'"""
+    return authors.str.lower().str.replace(r'[^a-z0-9]+', '', regex=True)
+
+def build_work_index(books_clean, ratings=None):
+    """Map each non-representative edition ISBN to its work's representative ISBN"""
+    keys = pd.DataFrame({
+        'ISBN': books_clean['ISBN'],
+        'title_key': normalize_titles(books_clean['Book-Title']),
+        'author_key': normalize_authors(books_clean['Book-Author'])
+    })
+    keys = keys[(keys['title_key'] != '') & (keys['author_key'] != '')]
+
+    if ratings is not None:
+        keys['rating_count'] = keys['ISBN'].map(ratings['ISBN'].value_counts()).fillna(0)
+        keys = keys.sort_values('rating_count', ascending=False, kind='stable')
+
+    keys['work'] = keys.groupby(['title_key', 'author_key'])['ISBN'].transform('first')
+    editions = keys[keys['ISBN'] != keys['work']]
+    return dict(zip(editions['ISBN'], editions['work']))
+
+def collapse_editions(ratings, isbn_to_work):
+    """Rewrite ratings to work ISBNs
+
+    A user's ratings of several editions of one work become their rounded mean,
+    so ratings stay whole numbers of the original dtype.
+    """
+    ratings = ratings.assign(ISBN=ratings['ISBN'].map(isbn_to_work).fillna(ratings['ISBN']))
+    collapsed = ratings.groupby(['User-ID', 'ISBN'], as_index=False)['Book-Rating'].mean()
+    collapsed['Book-Rating'] = collapsed['Book-Rating'].round().astype(ratings['Book-Rating'].dtype)
+    return collapsed
+
+def resolve_work(isbn, isbn_to_work):
+    """Representative ISBN of the work an ISBN belongs to"""
+    return isbn_to_work.get(isbn, isbn)